@@ -3,96 +3,55 @@ Evaluation Framework for Multi-Modal RAG
 Measures accuracy, precision, and recall on known test queries
 """
 from main import MultiModalRAG
+from eval_data import QUERIES, build_eval_set
 import json
+import os
+from collections import defaultdict
+from functools import lru_cache
+from heapq import nlargest, nsmallest
+import pickle
+import numpy as np
+import orjson
+
+SEARCH_CACHE_FILE = ".search_cache.pkl"
 
 # Evaluation dataset: queries with known correct answers
-EVAL_SET = [
-    {
-        "query": "Show me red footwear",
-        "expected_items": ["red_running_shoes.jpg"],
-        "category": "color + category"
-    },
-    {
-        "query": "What furniture is available?",
-        "expected_items": ["black_office_chair.jpg", "blue_armchair.jpg", "wooden_table.jpg"],
-        "category": "category"
-    },
-    {
-        "query": "Show me white products",
-        "expected_items": ["white_sneakers.jpg", "white_headphones.jpg"],
-        "category": "color"
-    },
-    {
-        "query": "What electronics under $300?",
-        "expected_items": ["white_headphones.jpg"],
-        "category": "category + price"
-    },
-    {
-        "query": "Show me brown items",
-        "expected_items": ["brown_boots.jpg", "wooden_table.jpg"],
-        "category": "color"
-    },
-    {
-        "query": "What can I use for running?",
-        "expected_items": ["red_running_shoes.jpg"],
-        "category": "use case"
-    },
-    {
-        "query": "Show me office equipment",
-        "expected_items": ["black_office_chair.jpg", "silver_laptop.jpg"],
-        "category": "use case"
-    },
-    {
-        "query": "What silver or gray products do you have?",
-        "expected_items": ["silver_laptop.jpg", "gray_backpack.jpg"],
-        "category": "color"
-    },
-    {
-        "query": "Show me footwear",
-        "expected_items": ["red_running_shoes.jpg", "white_sneakers.jpg", "brown_boots.jpg"],
-        "category": "category"
-    },
-    {
-        "query": "What can I use for listening to music?",
-        "expected_items": ["white_headphones.jpg"],
-        "category": "use case"
-    },
-    # Visual-only queries (not in text descriptions)
-    {
-        "query": "Show me items with laces",
-        "expected_items": ["red_running_shoes.jpg", "white_sneakers.jpg", "brown_boots.jpg"],
-        "category": "visual feature"
-    },
-    {
-        "query": "What has a screen?",
-        "expected_items": ["silver_laptop.jpg", "smartphone.jpg"],
-        "category": "visual feature"
-    },
-    {
-        "query": "Show me items with straps",
-        "expected_items": ["gray_backpack.jpg"],
-        "category": "visual feature"
-    },
-    {
-        "query": "What products are shiny or metallic?",
-        "expected_items": ["silver_laptop.jpg", "smartphone.jpg"],
-        "category": "visual property"
-    },
-]
+EVAL_SET = build_eval_set(QUERIES)
 
-def calculate_metrics(predicted, expected):
-    """Calculate precision, recall, F1"""
-    predicted_set = set(predicted)
-    expected_set = set(expected)
+# Bit position per product filename, assigned the first time a filename is seen
+FILENAME_BITS = {}
+
+def filename_mask(filenames):
+    """Encode a collection of filenames as a bitmask over FILENAME_BITS"""
+    mask = 0
+    for filename in filenames:
+        mask |= FILENAME_BITS.setdefault(filename, 1 << len(FILENAME_BITS))
+    return mask
+
+def popcount(mask):
+    """Number of set bits (int.bit_count() needs Python 3.10)"""
+    return bin(mask).count("1")
+
+@lru_cache(maxsize=512)
+def _confusion_counts(predicted, expected):
+    """TP/FP/FN for canonical (sorted tuple) inputs, memoized across queries"""
+    predicted_mask = filename_mask(predicted)
+    expected_mask = filename_mask(expected)
 
     # True positives: predicted AND expected
-    tp = len(predicted_set & expected_set)
+    tp = popcount(predicted_mask & expected_mask)
 
     # False positives: predicted but NOT expected
-    fp = len(predicted_set - expected_set)
+    fp = popcount(predicted_mask & ~expected_mask)
 
     # False negatives: expected but NOT predicted
-    fn = len(expected_set - predicted_set)
+    fn = popcount(expected_mask & ~predicted_mask)
+
+    return tp, fp, fn
+
+def calculate_metrics(predicted, expected):
+    """Calculate precision, recall, F1"""
+    tp, fp, fn = _confusion_counts(tuple(sorted(set(predicted))), tuple(sorted(set(expected))))
 
     # Precision: of what we returned, how much was correct?
     precision = tp / (tp + fp) if (tp + fp) > 0 else 0
@@ -112,6 +71,62 @@ def calculate_metrics(predicted, expected):
         "fn": fn
     }
 
+def current_index_version(rag):
+    """Version of the index the RAG currently searches, as recorded by index_data"""
+    return (rag.text_collection.metadata or {}).get("index_version")
+
+def prune_search_cache(rag, cache):
+    """Drop entries computed against any index other than the current one"""
+    index_version = current_index_version(rag)
+    return {key: value for key, value in cache.items() if key[0] == index_version}
+
+def load_search_cache(rag):
+    """Load cached search results from previous runs against the current index"""
+    if not os.path.exists(SEARCH_CACHE_FILE):
+        return {}
+    try:
+        with open(SEARCH_CACHE_FILE, "rb") as f:
+            return prune_search_cache(rag, pickle.load(f))
+    except Exception as e:
+        print(f"Ignoring unreadable search cache: {e}")
+        return {}
+
+def save_search_cache(rag, cache):
+    """Persist search results so the next run can skip repeated queries"""
+    with open(SEARCH_CACHE_FILE, "wb") as f:
+        pickle.dump(prune_search_cache(rag, cache), f)
+
+def search_cache_key(rag, query, top_k, filters=None):
+    """Cache key for a search, tied to the index it ran against"""
+    return (current_index_version(rag), "unified", query, top_k, json.dumps(filters, sort_keys=True))
+
+def cached_search(rag, cache, query, top_k, filters=None, query_embedding=None):
+    """Exact-match cache around rag.search_unified"""
+    key = search_cache_key(rag, query, top_k, filters)
+    if key not in cache:
+        cache[key] = rag.search_unified(query, n_results=top_k, query_embedding=query_embedding)
+    return cache[key]
+
+def embed_queries(rag, queries):
+    """Embed all queries in a single batched encoder call"""
+    if not queries:
+        return {}
+    embeddings = rag.embed(queries, batch_size=len(queries))
+    return dict(zip(queries, embeddings))
+
+def average_metrics(results):
+    """Average precision, recall, F1 over all queries in one vectorized pass"""
+    n = len(results)
+    tps = np.fromiter((r['metrics']['tp'] for r in results), dtype=np.int32, count=n)
+    fps = np.fromiter((r['metrics']['fp'] for r in results), dtype=np.int32, count=n)
+    fns = np.fromiter((r['metrics']['fn'] for r in results), dtype=np.int32, count=n)
+
+    precision = np.divide(tps, tps + fps, out=np.zeros(n), where=(tps + fps) > 0)
+    recall = np.divide(tps, tps + fns, out=np.zeros(n), where=(tps + fns) > 0)
+    f1 = np.divide(2 * precision * recall, precision + recall, out=np.zeros(n), where=(precision + recall) > 0)
+
+    return float(precision.mean()), float(recall.mean()), float(f1.mean())
+
 def run_evaluation(rag, top_k=3):
     """Run full evaluation on the eval set"""
     print("\n" + "="*70)
@@ -119,6 +134,13 @@ def run_evaluation(rag, top_k=3):
     print("="*70)
 
     results = []
+    search_cache = load_search_cache(rag)
+
+    # Embed every query that isn't already cached up front, in one batch
+    query_embeddings = embed_queries(rag, [
+        tc["query"] for tc in EVAL_SET
+        if search_cache_key(rag, tc["query"], top_k) not in search_cache
+    ])
 
     for i, test_case in enumerate(EVAL_SET, 1):
         query = test_case["query"]
@@ -129,17 +151,16 @@ def run_evaluation(rag, top_k=3):
         print(f"Expected: {expected}")
 
         # Search using multi-modal RAG
-        search_results = rag.search(query, n_results=top_k)
-
-        # Get predicted items (from both text and image results)
-        predicted = []
-        for r in search_results['text_results']:
-            predicted.append(r['metadata']['filename'])
-        for r in search_results['image_results']:
-            predicted.append(r['metadata']['filename'])
+        search_results = cached_search(
+            rag, search_cache, query, top_k,
+            query_embedding=query_embeddings.get(query)
+        )
 
-        # Remove duplicates
-        predicted = list(set(predicted))[:top_k]
+        # Get predicted items (text and image matches ranked together),
+        # removing duplicates while keeping rank order
+        predicted = list(dict.fromkeys(
+            r['metadata']['filename'] for r in search_results['results']
+        ))[:top_k]
 
         print(f"Predicted: {predicted}")
 
@@ -156,8 +177,60 @@ def run_evaluation(rag, top_k=3):
             "metrics": metrics
         })
 
+    save_search_cache(rag, search_cache)
+
     return results
 
+def sweep_f1(pred_masks, exp_masks):
+    """
+    F1 for every (query, top_k) cell in one vectorized pass
+
+    pred_masks: uint64 array (n_queries, max_k), column k = filename mask of the top k+1 predictions
+    exp_masks: uint64 array (n_queries,), filename mask of the expected items
+    """
+    exp_masks = exp_masks[:, None]
+    tp = np.bitwise_count(pred_masks & exp_masks)
+    fp = np.bitwise_count(pred_masks & ~exp_masks)
+    fn = np.bitwise_count(~pred_masks & exp_masks)
+
+    precision = np.divide(tp, tp + fp, out=np.zeros(tp.shape), where=(tp + fp) > 0)
+    recall = np.divide(tp, tp + fn, out=np.zeros(tp.shape), where=(tp + fn) > 0)
+    return np.divide(2 * precision * recall, precision + recall, out=np.zeros(tp.shape), where=(precision + recall) > 0)
+
+def run_top_k_sweep(rag, max_k=10):
+    """Average F1 for every top_k in 1..max_k, from a single search per query"""
+    search_cache = load_search_cache(rag)
+    query_embeddings = embed_queries(rag, [
+        tc["query"] for tc in EVAL_SET
+        if search_cache_key(rag, tc["query"], max_k) not in search_cache
+    ])
+
+    # Masks fit in uint64 as long as the catalog has at most 64 products
+    pred_masks = np.zeros((len(EVAL_SET), max_k), dtype=np.uint64)
+    exp_masks = np.zeros(len(EVAL_SET), dtype=np.uint64)
+
+    for i, test_case in enumerate(EVAL_SET):
+        query = test_case["query"]
+        search_results = cached_search(
+            rag, search_cache, query, max_k,
+            query_embedding=query_embeddings.get(query)
+        )
+        ranked = list(dict.fromkeys(
+            r['metadata']['filename'] for r in search_results['results']
+        ))
+
+        # Prefix masks: column k holds the top k+1 ranked predictions
+        mask = 0
+        for k in range(max_k):
+            if k < len(ranked):
+                mask |= filename_mask([ranked[k]])
+            pred_masks[i, k] = mask
+        exp_masks[i] = filename_mask(test_case["expected_items"])
+
+    save_search_cache(rag, search_cache)
+
+    return sweep_f1(pred_masks, exp_masks).mean(axis=0)
+
 def analyze_results(results):
     """Analyze overall performance"""
     print("\n" + "="*70)
@@ -165,9 +238,7 @@ def analyze_results(results):
     print("="*70)
 
     # Overall metrics
-    total_precision = sum(r['metrics']['precision'] for r in results) / len(results)
-    total_recall = sum(r['metrics']['recall'] for r in results) / len(results)
-    total_f1 = sum(r['metrics']['f1'] for r in results) / len(results)
+    total_precision, total_recall, total_f1 = average_metrics(results)
 
     print(f"\nAverage Precision: {total_precision:.2%}")
     print(f"Average Recall: {total_recall:.2%}")
@@ -178,46 +249,49 @@ def analyze_results(results):
     print("PERFORMANCE BY QUERY TYPE")
     print("-"*70)
 
-    categories = {}
+    # Running F1 sum and count per category, so the mean needs no second pass
+    category_f1 = defaultdict(float)
+    category_n = defaultdict(int)
     for result in results:
         cat = result['category']
-        if cat not in categories:
-            categories[cat] = []
-        categories[cat].append(result['metrics']['f1'])
+        category_f1[cat] += result['metrics']['f1']
+        category_n[cat] += 1
+
+    by_category = {cat: category_f1[cat] / category_n[cat] for cat in category_f1}
 
-    for cat, f1_scores in sorted(categories.items()):
-        avg_f1 = sum(f1_scores) / len(f1_scores)
-        print(f"{cat:20s}: {avg_f1:.2%} (n={len(f1_scores)})")
+    for cat, avg_f1 in sorted(by_category.items()):
+        print(f"{cat:20s}: {avg_f1:.2%} (n={category_n[cat]})")
 
     # Best and worst performing queries
     print("\n" + "-"*70)
     print("BEST PERFORMING QUERIES")
     print("-"*70)
 
-    sorted_results = sorted(results, key=lambda x: x['metrics']['f1'], reverse=True)
-    for result in sorted_results[:3]:
+    for result in nlargest(3, results, key=lambda x: x['metrics']['f1']):
         print(f"✓ {result['query']:40s} F1: {result['metrics']['f1']:.2%}")
 
     print("\n" + "-"*70)
     print("WORST PERFORMING QUERIES")
     print("-"*70)
 
-    for result in sorted_results[-3:]:
+    # Same picks and order as sorted(..., reverse=True)[-3:]: scanning the input backwards makes
+    # nsmallest keep the *last* tied queries, and reversing its output lists them best-first
+    for result in reversed(nsmallest(3, reversed(results), key=lambda x: x['metrics']['f1'])):
         print(f"✗ {result['query']:40s} F1: {result['metrics']['f1']:.2%}")
         print(f"  Expected: {result['expected']}")
         print(f"  Got: {result['predicted']}\n")
 
     # Save results
-    with open("eval_results.json", "w") as f:
-        json.dump({
+    with open("eval_results.json", "wb") as f:
+        f.write(orjson.dumps({
             "overall": {
                 "precision": total_precision,
                 "recall": total_recall,
                 "f1": total_f1
             },
-            "by_category": {cat: sum(scores)/len(scores) for cat, scores in categories.items()},
+            "by_category": by_category,
             "detailed_results": results
-        }, f, indent=2)
+        }, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
 
     print("\n" + "="*70)
     print("Results saved to: eval_results.json")
@@ -227,6 +301,7 @@ def main():
     print("Initializing Multi-Modal RAG system...")
     rag = MultiModalRAG()
 
+    # index_data() skips re-embedding when the persisted index matches data/descriptions.json
     print("\nIndexing products...")
     rag.index_data()
 
@@ -235,6 +310,12 @@ def main():
 
     analyze_results(results)
 
+    print("\n" + "-"*70)
+    print("AVERAGE F1 BY TOP_K")
+    print("-"*70)
+    for k, avg_f1 in enumerate(run_top_k_sweep(rag, max_k=10), 1):
+        print(f"top_k={k:2d}: {avg_f1:.2%}")
+
     print("\n" + "="*70)
     print("EVALUATION COMPLETE")
     print("="*70)
@@ -0,0 +1,69 @@
+"""
+Shared evaluation queries for the Multi-Modal RAG eval scripts
+Each query string appears once, so scripts can share embeddings and cached results
+"""
+
+# Queries with known correct answers, keyed by query string
+QUERIES = {
+    "Show me red footwear": {
+        "expected_items": ["red_running_shoes.jpg"],
+        "category": "color + category"
+    },
+    "What furniture is available?": {
+        "expected_items": ["black_office_chair.jpg", "blue_armchair.jpg", "wooden_table.jpg"],
+        "category": "category"
+    },
+    "Show me white products": {
+        "expected_items": ["white_sneakers.jpg", "white_headphones.jpg"],
+        "category": "color"
+    },
+    "What electronics under $300?": {
+        "expected_items": ["white_headphones.jpg"],
+        "category": "category + price"
+    },
+    "Show me brown items": {
+        "expected_items": ["brown_boots.jpg", "wooden_table.jpg"],
+        "category": "color"
+    },
+    "What can I use for running?": {
+        "expected_items": ["red_running_shoes.jpg"],
+        "category": "use case"
+    },
+    "Show me office equipment": {
+        "expected_items": ["black_office_chair.jpg", "silver_laptop.jpg"],
+        "category": "use case"
+    },
+    "What silver or gray products do you have?": {
+        "expected_items": ["silver_laptop.jpg", "gray_backpack.jpg"],
+        "category": "color"
+    },
+    "Show me footwear": {
+        "expected_items": ["red_running_shoes.jpg", "white_sneakers.jpg", "brown_boots.jpg"],
+        "category": "category"
+    },
+    "What can I use for listening to music?": {
+        "expected_items": ["white_headphones.jpg"],
+        "category": "use case"
+    },
+    # Visual-only queries (not in text descriptions)
+    "Show me items with laces": {
+        "expected_items": ["red_running_shoes.jpg", "white_sneakers.jpg", "brown_boots.jpg"],
+        "category": "visual feature"
+    },
+    "What has a screen?": {
+        "expected_items": ["silver_laptop.jpg", "smartphone.jpg"],
+        "category": "visual feature"
+    },
+    "Show me items with straps": {
+        "expected_items": ["gray_backpack.jpg"],
+        "category": "visual feature"
+    },
+    "What products are shiny or metallic?": {
+        "expected_items": ["silver_laptop.jpg", "smartphone.jpg"],
+        "category": "visual property"
+    }
+}
+
+def build_eval_set(queries):
+    """Build a list of test cases for the given query strings"""
+    return [{"query": query, **QUERIES[query]} for query in queries]
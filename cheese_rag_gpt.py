@@ -124,9 +124,8 @@ Return ONLY the JSON, no other text."""
                 # Get visual description from GPT-4 Vision
                 visual_desc = self.get_image_description_from_claude(str(image_path))
 
-                # Create embeddings
-                text_embedding = self.text_embedder.encode(text_desc).tolist()
-                visual_embedding = self.text_embedder.encode(visual_desc).tolist()
+                # Create embeddings (one forward pass for both descriptions)
+                text_embedding, visual_embedding = self.embed([text_desc, visual_desc], batch_size=2)
 
                 # Store in ChromaDB
                 self.text_collection.add(
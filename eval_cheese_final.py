@@ -2,6 +2,7 @@
 Final Evaluation - Compare Baseline (17% F1) vs GPT Categorization
 """
 import json
+import orjson
 from cheese_rag_gpt import CheeseRAGWithGPT
 
 # Test queries
@@ -95,13 +96,11 @@ def run_evaluation():
         # Search
         search_results = rag.smart_search(query, n_results=5)
 
-        # Get predicted titles
-        predicted = []
-        for r in search_results['text_results'] + search_results['image_results']:
-            title = r['metadata']['title']
-            if title not in predicted:
-                predicted.append(title)
-        predicted = predicted[:5]
+        # Get predicted titles, removing duplicates while keeping rank order
+        predicted = list(dict.fromkeys(
+            r['metadata']['title']
+            for r in search_results['text_results'] + search_results['image_results']
+        ))[:5]
 
         # Calculate metrics
         metrics = calculate_metrics(predicted, filters, all_products)
@@ -143,8 +142,8 @@ def run_evaluation():
             "num_queries": len(results)
         }
 
-        with open("final_results.json", "w") as f:
-            json.dump(output, f, indent=2)
+        with open("final_results.json", "wb") as f:
+            f.write(orjson.dumps(output, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
 
         print(f"\nResults saved to: final_results.json")
         print("="*70)
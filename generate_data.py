@@ -1,7 +1,8 @@
 """
 Download real product images from Unsplash
 """
-import requests
+import asyncio
+import httpx
 import json
 import os
 
@@ -99,6 +100,47 @@ PRODUCTS = [
     }
 ]
 
+def _product_metadata(product):
+    """Entry for data/descriptions.json"""
+    return {
+        "name": product['name'],
+        "color": product['color'],
+        "description": product['description'],
+        "category": product['category'],
+        "price": product['price']
+    }
+
+async def _download_one(client, product):
+    """Download a single product image, returning (filename, metadata or None)"""
+    filepath = os.path.join("images", product['filename'])
+
+    # Skip images already on disk from a previous run
+    if os.path.exists(filepath) and os.path.getsize(filepath) > 0:
+        print(f"✓ Already downloaded {filepath}")
+        return product['filename'], _product_metadata(product)
+
+    try:
+        # Download image (product images are well under 1MB, so buffer the whole body)
+        response = await client.get(product['url'])
+        response.raise_for_status()
+
+        # Save image in a single write
+        with open(filepath, 'wb') as f:
+            f.write(response.content)
+
+        print(f"✓ Saved to {filepath}")
+
+        return product['filename'], _product_metadata(product)
+
+    except Exception as e:
+        print(f"✗ Failed to download {product['filename']}: {e}")
+        return product['filename'], None
+
+async def _download_all():
+    """Fetch every product image concurrently over one HTTP/2 connection"""
+    async with httpx.AsyncClient(http2=True, timeout=30, follow_redirects=True) as client:
+        return await asyncio.gather(*[_download_one(client, product) for product in PRODUCTS])
+
 def download_images():
     """Download all images from Unsplash"""
     # Create images directory
@@ -106,36 +148,14 @@ def download_images():
 
     print("Downloading real product images from Unsplash...")
     print("="*60)
+    print(f"\nDownloading {len(PRODUCTS)} images concurrently...")
 
     descriptions = {}
 
-    for i, product in enumerate(PRODUCTS, 1):
-        print(f"\n[{i}/{len(PRODUCTS)}] Downloading {product['filename']}...")
-
-        try:
-            # Download image
-            response = requests.get(product['url'], stream=True)
-            response.raise_for_status()
-
-            # Save image
-            filepath = os.path.join("images", product['filename'])
-            with open(filepath, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-
-            print(f"✓ Saved to {filepath}")
-
-            # Add to descriptions
-            descriptions[product['filename']] = {
-                "name": product['name'],
-                "color": product['color'],
-                "description": product['description'],
-                "category": product['category'],
-                "price": product['price']
-            }
-
-        except Exception as e:
-            print(f"✗ Failed to download {product['filename']}: {e}")
+    # HTTP/2 multiplexes all downloads over a single TLS connection to the CDN
+    for filename, metadata in asyncio.run(_download_all()):
+        if metadata:
+            descriptions[filename] = metadata
 
     # Save descriptions.json
     os.makedirs("data", exist_ok=True)
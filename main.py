@@ -2,186 +2,636 @@
 Multi-Modal RAG System - FIXED WITH PERSISTENT CHROMADB
 Searches over both images and text descriptions using vision models and embeddings
 """
-from openai import OpenAI
-import json
 import os
+
+# BLAS/OpenMP thread pools are sized when torch loads, so set them before importing it
+os.environ.setdefault("OMP_NUM_THREADS", str(os.cpu_count() or 1))
+os.environ.setdefault("MKL_NUM_THREADS", str(os.cpu_count() or 1))
+
+from openai import OpenAI, AsyncOpenAI
+import asyncio
+import ijson
+import json
+import re
 import base64
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 from sentence_transformers import SentenceTransformer
 import chromadb
+import numpy as np
+import torch
+from transformers import AutoTokenizer
+
+# PyTorch's default intra-op thread count is often far below the core count
+torch.set_num_threads(os.cpu_count() or 1)
+try:
+    torch.set_num_interop_threads(2)
+except RuntimeError:
+    # Can only be set before any inter-op parallel work has started
+    pass
+
+DESCRIPTIONS_FILE = "data/descriptions.json"
+
+# Tags every row index_data writes; other indexes (e.g. CheeseRAGWithGPT) share these collections
+INDEX_SOURCE = DESCRIPTIONS_FILE
+
+# Positional IDs written by older versions of index_data, before IDs were keyed on filename
+LEGACY_ID_PATTERN = re.compile(r"(text|image)_\d+")
+
+# Max concurrent GPT-4 Vision requests while indexing (keeps us under rate limits)
+VISION_CONCURRENCY = 8
+
+# Fixed instruction for every vision call; as a system message it's an identical prompt prefix
+# that OpenAI's automatic prompt caching can reuse across images
+VISION_SYSTEM_PROMPT = "Describe this product image in detail. Focus on: color, type of item, key visual features, style. Be concise but specific."
+VISION_MAX_TOKENS = 120
+VISION_TIMEOUT = 30
+
+# On-disk cache of vision descriptions, one {sha256}.txt per (image bytes, prompt) pair
+VISION_CACHE_DIR = Path(".cache/vision")
+
+# INT8-quantized ONNX export shipped in the all-MiniLM-L6-v2 repo, used on CPU when
+# the ONNX backend is installed (pip install "sentence-transformers[onnx]")
+ONNX_MODEL_FILE = "onnx/model_qint8_avx2.onnx"
+
+# Cosine similarity above which a cached query is treated as the same question
+SEMANTIC_CACHE_THRESHOLD = 0.95
+
+# HNSW settings for every collection: cosine matches SBERT's normalized embedding geometry,
+# and for a catalog under ~10k products these give high recall at low single-digit ms latency.
+# Only applied when a collection is first created; delete chroma_db/ to rebuild with them.
+HNSW_METADATA = {
+    "hnsw:space": "cosine",
+    "hnsw:M": 16,
+    "hnsw:construction_ef": 200,
+    "hnsw:search_ef": 64
+}
+
+# Fields returned from collection queries; embeddings are never read back
+QUERY_INCLUDE = ["documents", "metadatas", "distances"]
+
+def build_where_clause(filters):
+    """ChromaDB where clause for a filters dict, or None when there are no filters"""
+    if not filters:
+        return None
+
+    where_conditions = []
+    for key, value in filters.items():
+        if isinstance(value, dict):
+            # Handle range queries like {"$lt": 300}
+            where_conditions.append({key: value})
+        else:
+            # Handle exact matches
+            where_conditions.append({key: {"$eq": value}})
+
+    # Combine conditions with AND
+    if len(where_conditions) == 1:
+        return where_conditions[0]
+    return {"$and": where_conditions}
 
 class MultiModalRAG:
-    def __init__(self):
+    def __init__(self, cache_size=256, cache_ttl=3600):
+        """
+        Args:
+            cache_size: Max number of queries kept in the semantic query cache
+            cache_ttl: Seconds before a cached search result / answer expires
+        """
         # Initialize OpenAI client
         self.client = OpenAI()
 
         # Initialize text embedding model
         print("Loading embedding model...")
-        self.text_embedder = SentenceTransformer('all-MiniLM-L6-v2')
+        device = self.select_device()
+        self.text_embedder, self.embedding_backend = self.load_text_embedder(device)
+        # Inference only: disables dropout and anything else training-specific
+        self.text_embedder.eval()
 
         # Initialize ChromaDB for vector storage (PERSISTENT TO DISK)
         self.chroma_client = chromadb.PersistentClient(
-            path="./chroma_db"
+            path=os.environ.get("CHROMA_DIR", "./chroma_db")
         )
 
         # Get or create collections for text and images
-        try:
-            self.text_collection = self.chroma_client.get_collection(
-                name="product_descriptions"
-            )
-            self.image_collection = self.chroma_client.get_collection(
-                name="product_images"
-            )
-            print("Loaded existing collections from disk")
-        except:
-            self.text_collection = self.chroma_client.create_collection(
-                name="product_descriptions"
-            )
-            self.image_collection = self.chroma_client.create_collection(
-                name="product_images"
-            )
-            print("Created new collections")
+        self.text_collection = self.chroma_client.get_or_create_collection(
+            name="product_descriptions",
+            metadata=HNSW_METADATA
+        )
+        self.image_collection = self.chroma_client.get_or_create_collection(
+            name="product_images",
+            metadata=HNSW_METADATA
+        )
+        print(f"Loaded collections ({self.text_collection.count()} products already indexed)")
+
+        # Combined collection holding both modalities, tagged by a "modality" metadata field
+        self.product_collection = self.chroma_client.get_or_create_collection(
+            name="products",
+            metadata=HNSW_METADATA
+        )
+
+        # Runs the text and image collection queries side by side
+        self._pool = ThreadPoolExecutor(max_workers=2)
+
+        # Exact-match LRU of query string -> embedding, shared by every search path
+        self.encode_query = lru_cache(maxsize=1024)(self._encode_query)
+
+        # Semantic query cache: entries of {embedding, params, results, answer, time}
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._qcache = []
+        # Exact-match answer cache: query string -> (answer result, time)
+        self._answer_cache = {}
 
         print("MultiModal RAG initialized!")
 
-    def load_image_as_base64(self, image_path):
-        """Convert image to base64 for Claude"""
-        with open(image_path, "rb") as image_file:
-            return base64.standard_b64encode(image_file.read()).decode("utf-8")
+    def select_device(self):
+        """Fastest available torch device for the embedder: CUDA, then Apple MPS, then CPU"""
+        if torch.cuda.is_available():
+            return 'cuda'
+        mps = getattr(torch.backends, "mps", None)
+        if mps is not None and mps.is_available():
+            return 'mps'
+        return 'cpu'
+
+    def load_text_embedder(self, device):
+        """Load the sentence embedder, preferring quantized ONNX Runtime on CPU"""
+        if device == 'cpu':
+            try:
+                embedder = SentenceTransformer(
+                    'all-MiniLM-L6-v2',
+                    backend='onnx',
+                    model_kwargs={"file_name": ONNX_MODEL_FILE, "provider": "CPUExecutionProvider"}
+                )
+                print(f"Using ONNX Runtime embedder ({ONNX_MODEL_FILE})")
+                return self.ensure_fast_tokenizer(embedder), f"onnx:{ONNX_MODEL_FILE}"
+            except Exception as e:
+                print(f"ONNX embedder unavailable, falling back to PyTorch: {e}")
+
+        embedder = SentenceTransformer('all-MiniLM-L6-v2', device=device)
+        return self.compile_embedder(self.ensure_fast_tokenizer(embedder)), "torch"
+
+    def compile_embedder(self, embedder):
+        """JIT-compile the PyTorch transformer with torch.compile, keeping eager mode if that fails"""
+        transformer = embedder[0]
+        eager_model = transformer.auto_model
+        try:
+            transformer.auto_model = torch.compile(eager_model, mode="reduce-overhead", dynamic=True)
+            # Compilation is lazy, so run one encode now to surface backend errors here
+            with torch.inference_mode():
+                embedder.encode("warmup")
+            print("Compiled embedding model with torch.compile")
+        except Exception as e:
+            transformer.auto_model = eager_model
+            print(f"torch.compile unavailable, using eager model: {e}")
+        return embedder
+
+    def ensure_fast_tokenizer(self, embedder):
+        """Swap in the Rust-backed fast tokenizer if the model loaded the slow Python one"""
+        if not getattr(embedder.tokenizer, "is_fast", False):
+            print("Replacing slow tokenizer with fast tokenizer")
+            embedder.tokenizer = AutoTokenizer.from_pretrained(
+                'sentence-transformers/all-MiniLM-L6-v2', use_fast=True
+            )
+        return embedder
+
+    def embed(self, sentences, **kwargs):
+        """Normalized embeddings for a string or list of strings, computed without autograd"""
+        with torch.inference_mode():
+            return self.text_embedder.encode(sentences, normalize_embeddings=True, **kwargs)
+
+    def image_bytes_to_data_url(self, image_bytes):
+        """Base64 JPEG data URL for an image's raw bytes"""
+        return f"data:image/jpeg;base64,{base64.b64encode(image_bytes).decode('ascii')}"
+
+    def vision_cache_path(self, image_bytes):
+        """Cache file for an image's description; the prompt is hashed in so prompt edits miss"""
+        digest = hashlib.sha256(image_bytes)
+        digest.update(f"{VISION_SYSTEM_PROMPT}|{VISION_MAX_TOKENS}".encode("utf-8"))
+        return VISION_CACHE_DIR / f"{digest.hexdigest()}.txt"
+
+    def save_vision_cache(self, cache_path, description):
+        """Store a description so the same image never re-hits the API"""
+        if description:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            cache_path.write_text(description, encoding="utf-8")
+
+    def vision_messages(self, image_url):
+        """Chat messages asking GPT-4 Vision to describe an image given as a data URL"""
+        return [
+            {
+                "role": "system",
+                "content": VISION_SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": image_url
+                        }
+                    }
+                ],
+            }
+        ]
 
     def get_image_description_from_claude(self, image_path):
         """Use GPT-4 Vision to describe the image"""
-        image_data = self.load_image_as_base64(image_path)
+        with open(image_path, "rb") as image_file:
+            image_bytes = image_file.read()
+
+        cache_path = self.vision_cache_path(image_bytes)
+        if cache_path.exists():
+            return cache_path.read_text(encoding="utf-8")
+
+        image_url = self.image_bytes_to_data_url(image_bytes)
 
         response = self.client.chat.completions.create(
             model="gpt-4o",
-            max_tokens=200,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{image_data}"
-                            }
-                        },
-                        {
-                            "type": "text",
-                            "text": "Describe this product image in detail. Focus on: color, type of item, key visual features, style. Be concise but specific."
-                        }
-                    ],
-                }
-            ],
+            max_tokens=VISION_MAX_TOKENS,
+            temperature=0,  # Deterministic descriptions
+            timeout=VISION_TIMEOUT,
+            messages=self.vision_messages(image_url),
         )
 
-        return response.choices[0].message.content
+        description = response.choices[0].message.content
+        self.save_vision_cache(cache_path, description)
+        return description
+
+    async def aget_image_description(self, aclient, image_path, semaphore):
+        """Async version of get_image_description_from_claude, bounded by semaphore"""
+        # Disk reads + hashing/base64 run in a worker thread so they don't block the event loop
+        image_bytes = await asyncio.to_thread(Path(image_path).read_bytes)
+
+        # Cache hits never wait on the semaphore
+        cache_path = await asyncio.to_thread(self.vision_cache_path, image_bytes)
+        if cache_path.exists():
+            print(f"  Cached {os.path.basename(image_path)}")
+            return cache_path.read_text(encoding="utf-8")
+
+        image_url = await asyncio.to_thread(self.image_bytes_to_data_url, image_bytes)
+
+        async with semaphore:
+            response = await aclient.chat.completions.create(
+                model="gpt-4o",
+                max_tokens=VISION_MAX_TOKENS,
+                temperature=0,  # Deterministic descriptions
+                timeout=VISION_TIMEOUT,
+                messages=self.vision_messages(image_url),
+            )
 
-    def index_data(self):
-        """Index both images and text descriptions"""
-        # Load descriptions
-        with open("data/descriptions.json", "r") as f:
-            descriptions = json.load(f)
+        print(f"  Described {os.path.basename(image_path)}")
+        description = response.choices[0].message.content
+        self.save_vision_cache(cache_path, description)
+        return description
+
+    async def describe_all_images(self, image_paths):
+        """Describe all images concurrently, returned in the same order as image_paths"""
+        semaphore = asyncio.Semaphore(VISION_CONCURRENCY)
+        # A fresh client per run: its connection pool is bound to this asyncio.run() event loop,
+        # which is closed once indexing finishes
+        async with AsyncOpenAI() as aclient:
+            return await asyncio.gather(*[
+                self.aget_image_description(aclient, image_path, semaphore) for image_path in image_paths
+            ])
+
+    def product_fingerprint(self, filename, info, image_path):
+        """Hash of a product's metadata, image mtime and embedder; changes whenever it needs re-indexing"""
+        mtime = os.path.getmtime(image_path) if os.path.exists(image_path) else None
+        # Quantized and FP32 embeddings aren't interchangeable, so the backend is part of the fingerprint
+        payload = json.dumps([filename, info, mtime, self.embedding_backend], sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def count_indexed(self, collection):
+        """Number of rows in a collection written by index_data (other indexes' rows excluded)"""
+        return len(collection.get(where={"source": INDEX_SOURCE}, include=[])['ids'])
+
+    def is_index_current(self, index_version, n_products):
+        """Check whether the persisted collections were built from exactly these products"""
+        metadata = self.text_collection.metadata or {}
+        return (
+            metadata.get("index_version") == index_version
+            and self.count_indexed(self.text_collection) == n_products
+            and self.count_indexed(self.image_collection) == n_products
+            and self.count_indexed(self.product_collection) == 2 * n_products
+        )
 
-        print(f"\nIndexing {len(descriptions)} products...")
+    def indexed_fingerprints(self, collection, ids):
+        """id -> stored fingerprint for those of ids that index_data wrote to the collection"""
+        existing = collection.get(ids=ids, include=["metadatas"])
+        return {
+            id_: metadata.get("fingerprint")
+            for id_, metadata in zip(existing['ids'], existing['metadatas'])
+            if metadata and metadata.get("source") == INDEX_SOURCE
+        }
+
+    def find_stale_products(self, text_ids, image_ids, fingerprints):
+        """Indices of products that are missing from the index or changed since they were indexed"""
+        text_fingerprints = self.indexed_fingerprints(self.text_collection, text_ids)
+        image_fingerprints = self.indexed_fingerprints(self.image_collection, image_ids)
+        product_fingerprints = self.indexed_fingerprints(self.product_collection, text_ids + image_ids)
+
+        return [
+            i for i, fingerprint in enumerate(fingerprints)
+            if not (
+                text_fingerprints.get(text_ids[i])
+                == image_fingerprints.get(image_ids[i])
+                == product_fingerprints.get(text_ids[i])
+                == product_fingerprints.get(image_ids[i])
+                == fingerprint
+            )
+        ]
+
+    def remove_deleted_products(self, text_ids, image_ids):
+        """Delete entries index_data wrote for products no longer in the descriptions file"""
+        current_ids = set(text_ids) | set(image_ids)
+        removed = 0
+        for collection in (self.text_collection, self.image_collection, self.product_collection):
+            existing = collection.get(include=["metadatas"])
+            # Only rows this index owns: tagged with INDEX_SOURCE, or left over from positional IDs
+            orphaned_ids = [
+                id_ for id_, metadata in zip(existing['ids'], existing['metadatas'])
+                if id_ not in current_ids
+                and ((metadata or {}).get("source") == INDEX_SOURCE or LEGACY_ID_PATTERN.fullmatch(id_))
+            ]
+            if orphaned_ids:
+                collection.delete(ids=orphaned_ids)
+                removed += len(orphaned_ids)
+        return removed
+
+    def iter_descriptions(self):
+        """Stream (filename, info) pairs from the descriptions file without loading it whole"""
+        with open(DESCRIPTIONS_FILE, "rb") as f:
+            # use_float keeps prices as floats rather than Decimal, which Chroma can't store
+            yield from ijson.kvitems(f, "", use_float=True)
 
+    def index_data(self):
+        """Index both images and text descriptions"""
         text_docs = []
-        text_embeddings = []
         text_ids = []
         text_metadatas = []
 
-        image_docs = []
-        image_embeddings = []
+        filenames = []
+        image_paths = []
         image_ids = []
-        image_metadatas = []
+        fingerprints = []
 
-        for i, (filename, info) in enumerate(descriptions.items()):
+        # Phase 1: build documents and metadata
+        for filename, info in self.iter_descriptions():
             image_path = f"images/{filename}"
+            fingerprint = self.product_fingerprint(filename, info, image_path)
 
-            # Index text description
-            text_content = f"{info['name']} - {info['description']} - {info['color']} - {info['category']}"
-            text_embedding = self.text_embedder.encode(text_content).tolist()
-
-            text_docs.append(text_content)
-            text_embeddings.append(text_embedding)
-            text_ids.append(f"text_{i}")
+            text_docs.append(f"{info['name']} - {info['description']} - {info['color']} - {info['category']}")
+            # Keyed on filename so adding/removing a product never shifts other products' IDs
+            text_ids.append(f"text_{filename}")
             text_metadatas.append({
                 "filename": filename,
                 "name": info['name'],
                 "color": info['color'],
                 "category": info['category'],
-                "price": info['price']
+                "price": info['price'],
+                "fingerprint": fingerprint,
+                "source": INDEX_SOURCE
             })
 
-            # Index image using Claude's vision
-            print(f"Processing image {i+1}/{len(descriptions)}: {filename}")
-            image_description = self.get_image_description_from_claude(image_path)
-            image_embedding = self.text_embedder.encode(image_description).tolist()
+            filenames.append(filename)
+            image_paths.append(image_path)
+            image_ids.append(f"image_{filename}")
+            fingerprints.append(fingerprint)
+
+        # Skip the expensive vision + embedding pass entirely if nothing changed on disk
+        index_version = hashlib.sha256("".join(fingerprints).encode("utf-8")).hexdigest()
+        if self.is_index_current(index_version, len(fingerprints)):
+            print(f"\nIndex up to date ({len(fingerprints)} products), skipping re-indexing")
+            return
+
+        # Drop products that were removed from the descriptions file
+        removed = self.remove_deleted_products(text_ids, image_ids)
+        if removed:
+            print(f"\nRemoved {removed} entries for products no longer in {DESCRIPTIONS_FILE}")
+            self.clear_query_caches()
+
+        # Otherwise only re-process products that are new or changed
+        stale = self.find_stale_products(text_ids, image_ids, fingerprints)
+        print(f"\nIndexing {len(stale)} new/changed products ({len(fingerprints) - len(stale)} already indexed)...")
+
+        def pick(items):
+            return [items[i] for i in stale]
+
+        text_docs, text_ids, text_metadatas = pick(text_docs), pick(text_ids), pick(text_metadatas)
+        filenames, image_paths, image_ids = pick(filenames), pick(image_paths), pick(image_ids)
+
+        if stale:
+            self.index_products(text_docs, text_ids, text_metadatas, filenames, image_paths, image_ids)
+
+        # Remember which set of products this index was built from
+        # (HNSW settings can't be modified after creation, so they're left out of the update)
+        self.text_collection.modify(metadata={
+            **{k: v for k, v in (self.text_collection.metadata or {}).items() if not k.startswith("hnsw:")},
+            "index_version": index_version
+        })
+
+        print(f"\n✓ Indexed {len(text_docs)} text descriptions")
+        print(f"✓ Indexed {len(image_ids)} images with visual descriptions")
+
+    def index_products(self, text_docs, text_ids, text_metadatas, filenames, image_paths, image_ids):
+        """Describe, embed and store the given products"""
+        # Cached results and answers were computed against the old index
+        self.clear_query_caches()
 
-            image_docs.append(image_description)
-            image_embeddings.append(image_embedding)
-            image_ids.append(f"image_{i}")
+        # Phase 2: describe all images concurrently using GPT-4 Vision
+        print(f"Describing {len(image_paths)} images (up to {VISION_CONCURRENCY} at a time)...")
+        image_docs = asyncio.run(self.describe_all_images(image_paths))
+
+        image_metadatas = []
+        for filename, image_path, image_description, text_metadata in zip(
+            filenames, image_paths, image_docs, text_metadatas
+        ):
             image_metadatas.append({
                 "filename": filename,
                 "image_path": image_path,
-                "visual_description": image_description
+                "visual_description": image_description,
+                "fingerprint": text_metadata["fingerprint"],
+                "source": INDEX_SOURCE
             })
 
-        # Add to ChromaDB
-        self.text_collection.add(
+        # Phase 3: embed texts and image descriptions together in one batched encoder call,
+        # then split the output back into the two halves (float32 ndarray views, no list copies)
+        all_embeddings = self.embed(
+            text_docs + image_docs, batch_size=64, show_progress_bar=True, convert_to_numpy=True
+        )
+        text_embeddings = all_embeddings[:len(text_docs)]
+        image_embeddings = all_embeddings[len(text_docs):]
+
+        # Add to ChromaDB (upsert so stale entries get overwritten)
+        self.text_collection.upsert(
             documents=text_docs,
             embeddings=text_embeddings,
             ids=text_ids,
             metadatas=text_metadatas
         )
 
-        self.image_collection.add(
+        self.image_collection.upsert(
             documents=image_docs,
             embeddings=image_embeddings,
             ids=image_ids,
             metadatas=image_metadatas
         )
 
-        print(f"\n✓ Indexed {len(text_docs)} text descriptions")
-        print(f"✓ Indexed {len(image_docs)} images with visual descriptions")
+        self.product_collection.upsert(
+            documents=text_docs + image_docs,
+            embeddings=all_embeddings,
+            ids=text_ids + image_ids,
+            metadatas=[{**m, "modality": "text"} for m in text_metadatas]
+                      + [{**m, "modality": "image"} for m in image_metadatas]
+        )
+
+    def _encode_query(self, query):
+        """Embed a single query string (wrapped in a per-instance LRU as self.encode_query)"""
+        query_embedding = self.embed(query)
+        # The cached array is shared between callers, so keep it from being modified in place
+        query_embedding.setflags(write=False)
+        return query_embedding
+
+    def clear_query_caches(self):
+        """Forget cached search results and answers (query embeddings stay valid)"""
+        self._qcache = []
+        self._answer_cache = {}
+
+    def cache_lookup(self, query_embedding, params):
+        """Most similar live cache entry searched with the same params, if above the threshold"""
+        now = time.time()
+        self._qcache = [e for e in self._qcache if now - e["time"] < self.cache_ttl]
+
+        candidates = [e for e in self._qcache if e["params"] == params]
+        if not candidates:
+            return None
+
+        # Embeddings are stored unit-length, so the dot product is cosine similarity
+        similarities = np.stack([e["embedding"] for e in candidates]) @ query_embedding
+        best = int(np.argmax(similarities))
+        return candidates[best] if similarities[best] >= SEMANTIC_CACHE_THRESHOLD else None
+
+    def cached_search_entry(self, query, n_results=3, search_images=True, search_text=True):
+        """Search through the semantic query cache, returning its cache entry"""
+        # Unit-length, so it serves as both the Chroma query and the cosine cache key
+        query_embedding = self.encode_query(query)
+        params = (n_results, search_images, search_text)
+
+        entry = self.cache_lookup(query_embedding, params)
+        if entry is None:
+            entry = {
+                "embedding": query_embedding,
+                "params": params,
+                "results": self.search_with_embedding(
+                    query,
+                    query_embedding,
+                    n_results=n_results,
+                    search_images=search_images,
+                    search_text=search_text
+                ),
+                "answer": None,
+                "time": time.time()
+            }
+            self._qcache.append(entry)
+            if len(self._qcache) > self.cache_size:
+                self._qcache.pop(0)
+
+        return entry
 
     def search(self, query, n_results=3, search_images=True, search_text=True):
         """Search across images and/or text"""
-        query_embedding = self.text_embedder.encode(query).tolist()
+        entry = self.cached_search_entry(query, n_results, search_images, search_text)
+        return {**entry["results"], "query": query}
+
+    def search_with_embedding(self, query, query_embedding, n_results=3, search_images=True, search_text=True):
+        """Search across images and/or text with a precomputed query embedding"""
+        return self.search_with_embeddings(
+            [query],
+            np.reshape(query_embedding, (1, -1)),
+            n_results=n_results,
+            search_images=search_images,
+            search_text=search_text
+        )[0]
+
+    def batch_search(self, queries, n_results=3, search_images=True, search_text=True):
+        """Search many queries at once: one batched encode plus one query per collection"""
+        if not queries:
+            return []
+
+        return self.search_with_embeddings(
+            queries,
+            self.embed(queries, convert_to_numpy=True),
+            n_results=n_results,
+            search_images=search_images,
+            search_text=search_text
+        )
+
+    def search_with_embeddings(self, queries, query_embeddings, n_results=3, search_images=True, search_text=True):
+        """Search with one precomputed embedding row per query, returning a results dict per query"""
+        text_future, image_future = self._query_collections(
+            query_embeddings, n_results, search_images=search_images, search_text=search_text
+        )
+        text_results = text_future.result() if text_future else None
+        image_results = image_future.result() if image_future else None
+
+        # Row i of each batched response belongs to queries[i]
+        return [
+            {
+                "query": query,
+                "text_results": self._rows(text_results, i, "content") if text_results else [],
+                "image_results": self._rows(image_results, i, "visual_description") if image_results else []
+            }
+            for i, query in enumerate(queries)
+        ]
+
+    def _query_collections(self, query_embeddings, n_results, where=None, search_images=True, search_text=True):
+        """Start the text and image collection queries concurrently, returning (text, image) futures"""
+        # Chroma releases the GIL during ANN search, so the two queries overlap
+        query_embeddings = np.asarray(query_embeddings, dtype=np.float32)
+        text_future = self._pool.submit(
+            self.text_collection.query,
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where=where,
+            include=QUERY_INCLUDE
+        ) if search_text else None
+        image_future = self._pool.submit(
+            self.image_collection.query,
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where=where,
+            include=QUERY_INCLUDE
+        ) if search_images else None
+        return text_future, image_future
+
+    def _rows(self, raw, i, doc_key):
+        """Result dicts for row i of a Chroma query response, with the document under doc_key"""
+        return [
+            {doc_key: doc, "metadata": meta, "distance": dist}
+            for doc, meta, dist in zip(raw['documents'][i], raw['metadatas'][i], raw['distances'][i])
+        ]
+
+    def search_unified(self, query, n_results=3, query_embedding=None):
+        """Search text and image descriptions with a single query over the combined collection"""
+        if query_embedding is None:
+            query_embedding = self.encode_query(query)
 
         results = {
             "query": query,
-            "text_results": [],
-            "image_results": []
+            "results": []
         }
 
-        # Search text descriptions
-        if search_text:
-            text_results = self.text_collection.query(
-                query_embeddings=[query_embedding],
-                n_results=n_results
-            )
-
-            for i in range(len(text_results['ids'][0])):
-                results["text_results"].append({
-                    "content": text_results['documents'][0][i],
-                    "metadata": text_results['metadatas'][0][i],
-                    "distance": text_results['distances'][0][i]
-                })
-
-        # Search images
-        if search_images:
-            image_results = self.image_collection.query(
-                query_embeddings=[query_embedding],
-                n_results=n_results
-            )
+        # Each product has at most two entries (text + image), so 2x always covers n_results products
+        unified_results = self.product_collection.query(
+            query_embeddings=np.asarray(query_embedding, dtype=np.float32).reshape(1, -1),
+            n_results=n_results * 2,
+            include=QUERY_INCLUDE
+        )
 
-            for i in range(len(image_results['ids'][0])):
-                results["image_results"].append({
-                    "visual_description": image_results['documents'][0][i],
-                    "metadata": image_results['metadatas'][0][i],
-                    "distance": image_results['distances'][0][i]
-                })
+        results["results"] = self._rows(unified_results, 0, "content")
 
         return results
 
@@ -277,7 +727,7 @@ Now extract filters from: "{query}"
             search_images: Whether to search image descriptions
             search_text: Whether to search text descriptions
         """
-        query_embedding = self.text_embedder.encode(query).tolist()
+        query_embeddings = self.encode_query(query).reshape(1, -1)
 
         results = {
             "query": query,
@@ -287,56 +737,32 @@ Now extract filters from: "{query}"
         }
 
         # Build where clause for ChromaDB
-        where_clause = None
-        if filters:
-            where_conditions = []
-            for key, value in filters.items():
-                if isinstance(value, dict):
-                    # Handle range queries like {"$lt": 300}
-                    where_conditions.append({key: value})
-                else:
-                    # Handle exact matches
-                    where_conditions.append({key: {"$eq": value}})
-
-            # Combine conditions with AND
-            if len(where_conditions) == 1:
-                where_clause = where_conditions[0]
-            else:
-                where_clause = {"$and": where_conditions}
+        where_clause = build_where_clause(filters)
+
+        # Chroma applies the where clause before ranking, so unfiltered queries need no overfetch;
+        # filtered ones get a small bounded margin
+        fetch_n = n_results if where_clause is None else min(n_results * 2, n_results + 5)
+
+        # Issue the filtered text and image queries concurrently
+        text_future, image_future = self._query_collections(
+            query_embeddings, fetch_n, where=where_clause, search_images=search_images, search_text=search_text
+        )
 
         # Search text descriptions with filters
-        if search_text:
+        if text_future:
             try:
-                text_results = self.text_collection.query(
-                    query_embeddings=[query_embedding],
-                    n_results=n_results * 2,  # Get more results to account for filtering
-                    where=where_clause
-                )
+                text_results = text_future.result()
 
-                for i in range(min(n_results, len(text_results['ids'][0]))):
-                    results["text_results"].append({
-                        "content": text_results['documents'][0][i],
-                        "metadata": text_results['metadatas'][0][i],
-                        "distance": text_results['distances'][0][i]
-                    })
+                results["text_results"] = self._rows(text_results, 0, "content")[:n_results]
             except Exception as e:
                 print(f"Text search error: {e}")
 
         # Search images with filters
-        if search_images:
+        if image_future:
             try:
-                image_results = self.image_collection.query(
-                    query_embeddings=[query_embedding],
-                    n_results=n_results * 2,
-                    where=where_clause
-                )
+                image_results = image_future.result()
 
-                for i in range(min(n_results, len(image_results['ids'][0]))):
-                    results["image_results"].append({
-                        "visual_description": image_results['documents'][0][i],
-                        "metadata": image_results['metadatas'][0][i],
-                        "distance": image_results['distances'][0][i]
-                    })
+                results["image_results"] = self._rows(image_results, 0, "visual_description")[:n_results]
             except Exception as e:
                 print(f"Image search error: {e}")
 
@@ -344,8 +770,16 @@ Now extract filters from: "{query}"
 
     def answer_question(self, query):
         """Use RAG to answer a question about products"""
-        # Get relevant context
-        search_results = self.search(query, n_results=3)
+        # Exact repeat of a recent question: no embedding, search or LLM call
+        cached = self._answer_cache.get(query)
+        if cached and time.time() - cached[1] < self.cache_ttl:
+            return cached[0]
+
+        # Get relevant context (a semantically similar cached question also reuses its answer)
+        entry = self.cached_search_entry(query, n_results=3)
+        if entry["answer"] is not None:
+            return self.remember_answer(query, entry["answer"])
+        search_results = entry["results"]
 
         # Build context for Claude
         context_parts = []
@@ -378,10 +812,18 @@ Be specific and reference the products you're talking about."""
             ],
         )
 
-        return {
+        entry["answer"] = {
             "answer": response.choices[0].message.content,
             "sources": search_results
         }
+        return self.remember_answer(query, entry["answer"])
+
+    def remember_answer(self, query, result):
+        """Store an answer in the exact-match cache, evicting the oldest past cache_size"""
+        self._answer_cache[query] = (result, time.time())
+        if len(self._answer_cache) > self.cache_size:
+            del self._answer_cache[next(iter(self._answer_cache))]
+        return result
 
 
 def main():
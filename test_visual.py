@@ -12,9 +12,9 @@ test_queries = [
     "What products are shiny?",     # Surface property
 ]
 
-for query in test_queries:
+# One batched encode + one image-collection query for all test queries
+for query, results in zip(test_queries, rag.batch_search(test_queries, n_results=2, search_text=False)):
     print(f"\nQuery: {query}")
-    results = rag.search(query, n_results=2)
 
     print("Visual matches:")
     for r in results['image_results']: